@@ -1,16 +1,19 @@
 from __future__ import annotations
 
 import argparse
-import json
 import logging
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import List, Tuple
 
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from numba import njit
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder
 
 LOGGER = logging.getLogger("yield_prep")
 
@@ -24,6 +27,15 @@ DATA_DIR = BACKEND_DIR / "data" / "kz"
 ARTIFACTS_DIR = BACKEND_DIR / "artifacts"
 MODELS_DIR = BACKEND_DIR / "app" / "models"
 TARGET_COLUMN = "yield_kg_per_ha"
+CSV_BLOCK_SIZE = 64 << 20  # bytes per parse block; read_csv converts blocks in parallel
+RAW_COLUMN_TYPES = {
+    "Year": pa.int32(),
+    "Value": pa.float64(),
+    "Area": pa.string(),
+    "Element": pa.string(),
+    "Item": pa.string(),
+    "Unit": pa.string(),
+}
 
 
 @dataclass
@@ -48,6 +60,30 @@ def _snake_case(value: str) -> str:
     )
 
 
+def _snake_case_series(values: pd.Series) -> pd.Series:
+    return values.str.strip().str.lower().str.replace(r"[/\- ]", "_", regex=True)
+
+
+@njit(cache=True, error_model="numpy")
+def _grouped_pct_change(values: np.ndarray, starts: np.ndarray, out: np.ndarray) -> None:
+    # Rows are contiguous per group; matches pct_change(fill_method=None) within each group.
+    n_rows = values.shape[0]
+    n_groups = starts.shape[0]
+    for group in range(n_groups):
+        start = starts[group]
+        end = starts[group + 1] if group + 1 < n_groups else n_rows
+        out[start] = np.nan
+        for i in range(start + 1, end):
+            out[i] = values[i] / values[i - 1] - 1.0
+
+
+def _pct_change_by_group(values: pd.Series, starts: np.ndarray) -> np.ndarray:
+    array = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    out = np.empty_like(array)
+    _grouped_pct_change(array, starts, out)
+    return out
+
+
 def load_raw_frames(data_dir: Path) -> pd.DataFrame:
     csv_paths = sorted(data_dir.glob("*.csv"))
     if not csv_paths:
@@ -55,18 +91,23 @@ def load_raw_frames(data_dir: Path) -> pd.DataFrame:
             f"No CSV files found under {data_dir}. "
             "Place Kazakhstan agro CSVs before running the prep script."
         )
-    frames: List[pd.DataFrame] = []
+    read_options = pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE)
+    convert_options = pacsv.ConvertOptions(column_types=RAW_COLUMN_TYPES)
+    tables: List[pa.Table] = []
     for path in csv_paths:
         LOGGER.info("Loading %s", path.name)
-        frames.append(pd.read_csv(path))
-    data = pd.concat(frames, ignore_index=True)
+        tables.append(
+            pacsv.read_csv(path, read_options=read_options, convert_options=convert_options)
+        )
+    data = pa.concat_tables(tables, promote_options="default").to_pandas(
+        types_mapper=pd.ArrowDtype
+    )
     LOGGER.info("Combined %s rows from %s files", len(data), len(csv_paths))
     return data
 
 
 def tidy_dataframe(raw_df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], List[str]]:
-    df = raw_df.copy()
-    df.columns = [_snake_case(col) for col in df.columns]
+    column_names = {col: _snake_case(col) for col in raw_df.columns}
     expected_columns = {
         "area",
         "element",
@@ -75,23 +116,28 @@ def tidy_dataframe(raw_df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], List[
         "value",
         "year",
     }
-    missing = expected_columns - set(df.columns)
+    missing = expected_columns - set(column_names.values())
     if missing:
         raise ValueError(f"Missing expected columns in dataset: {missing}")
+    # Only the expected columns are touched below, so copy just those.
+    source_columns = [col for col, name in column_names.items() if name in expected_columns]
+    df = raw_df[source_columns].set_axis(
+        [column_names[col] for col in source_columns], axis=1
+    )
 
     df["year"] = pd.to_numeric(df["year"], errors="coerce").astype("Int64")
     df["value"] = pd.to_numeric(df["value"], errors="coerce")
-    df["element"] = df["element"].apply(_snake_case)
+    df["element"] = _snake_case_series(df["element"])
     df["item"] = df["item"].fillna("Unknown crop").str.strip()
-    df["crop_type"] = df["item"].str.lower().str.replace(" ", "_")
+    df["crop_type"] = _snake_case_series(df["item"])
+    df["element"] = df["element"].astype("category")
+    df["crop_type"] = df["crop_type"].astype("category")
 
     pivot = (
-        df.pivot_table(
-            values="value",
-            index=["year", "crop_type"],
-            columns="element",
-            aggfunc="mean",
-        )
+        df.groupby(["year", "crop_type", "element"], sort=False, observed=True)["value"]
+        .mean()
+        .unstack("element")
+        .sort_index(axis=1)
         .reset_index()
         .rename_axis(None, axis=1)
     )
@@ -111,15 +157,16 @@ def tidy_dataframe(raw_df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], List[
 
     pivot["year"] = pivot["year"].astype(int)
     pivot = pivot.sort_values(["crop_type", "year"]).reset_index(drop=True)
-    pivot["production_per_area"] = pivot["production_t"] / pivot["area_harvested_ha"].replace(
-        {0: pd.NA}
-    )
-    pivot["area_change_rate"] = pivot.groupby("crop_type")["area_harvested_ha"].pct_change(
-        fill_method=None
-    )
-    pivot["yield_change_rate"] = pivot.groupby("crop_type")[TARGET_COLUMN].pct_change(
-        fill_method=None
-    )
+    area = pivot["area_harvested_ha"].to_numpy(dtype=np.float64, na_value=np.nan)
+    production = pivot["production_t"].to_numpy(dtype=np.float64, na_value=np.nan)
+    production_per_area = np.full_like(area, np.nan)
+    np.divide(production, area, out=production_per_area, where=area != 0.0)
+    pivot["production_per_area"] = production_per_area
+    # pivot is sorted by crop_type, so each crop occupies one contiguous run of rows.
+    codes, _ = pd.factorize(pivot["crop_type"], sort=False)
+    group_starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    pivot["area_change_rate"] = _pct_change_by_group(pivot["area_harvested_ha"], group_starts)
+    pivot["yield_change_rate"] = _pct_change_by_group(pivot[TARGET_COLUMN], group_starts)
     pivot = pivot.ffill().bfill()
     pivot = pivot.dropna(subset=[TARGET_COLUMN])
 
@@ -169,13 +216,10 @@ def compute_feature_manifest(
     categorical_features: List[str],
 ) -> List[str]:
     feature_names = list(numeric_features)
-    if categorical_features:
-        encoder = OneHotEncoder(
-            handle_unknown="ignore", sparse_output=False
-        )
-        encoder.fit(train_df[categorical_features])
-        cat_names = encoder.get_feature_names_out(categorical_features).tolist()
-        feature_names.extend(cat_names)
+    # Mirrors OneHotEncoder.get_feature_names_out: one column per observed level.
+    for col in categorical_features:
+        levels = sorted(train_df[col].dropna().unique())
+        feature_names.extend(f"{col}_{level}" for level in levels)
     return feature_names
 
 
@@ -187,16 +231,21 @@ def save_splits(
 ) -> None:
     data_dir = run_dir / "data"
     data_dir.mkdir(parents=True, exist_ok=True)
-    train_df.to_csv(data_dir / "train.csv", index=False)
-    val_df.to_csv(data_dir / "val.csv", index=False)
-    test_df.to_csv(data_dir / "test.csv", index=False)
+    for name, frame in (("train", train_df), ("val", val_df), ("test", test_df)):
+        frame.to_parquet(
+            data_dir / f"{name}.parquet", engine="pyarrow", compression="zstd", index=False
+        )
     LOGGER.info("Persisted cleaned splits to %s", data_dir)
 
 
 def write_json(path: Path, payload: dict | list) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as fh:
-        json.dump(payload, fh, indent=2)
+    path.write_bytes(
+        orjson.dumps(
+            payload,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    )
     LOGGER.info("Wrote %s", path)
 
 
@@ -1,27 +1,45 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
+import logging
 import os
-import secrets
+import shutil
 import time
-from collections import defaultdict, deque
+from collections import defaultdict
 from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache
 from pathlib import Path
-from threading import Lock
-from typing import Any, Dict, List, Optional
+from tempfile import SpooledTemporaryFile
+from typing import IO, Any, Dict, List, Optional
 
+import aiofiles
+import orjson
 from fastapi import FastAPI, File, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 from pydantic import BaseModel, EmailStr, Field, ValidationError
+from starlette.formparsers import MultiPartParser
 
 from .ml_model import disease_model, get_model_status, yield_model
-from .services import build_dashboard_metrics, list_data_assets, yield_history_payload
+from .services import (
+    build_dashboard_metrics,
+    directory_fingerprint,
+    list_data_assets,
+    yield_history_payload,
+)
+
+LOGGER = logging.getLogger("geoportal.main")
+
 
+UTC = timezone.utc
 
-def utc_now() -> str:
-    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+def utc_now(moment: datetime | None = None) -> str:
+    stamp = (moment or datetime.now(UTC)).isoformat(timespec="microseconds")
+    return stamp.replace("+00:00", "Z")
 
 
 APP_DIR = Path(__file__).resolve().parent
@@ -39,6 +57,9 @@ ARTIFACTS_DIR.mkdir(parents=True, exist_ok=True)
 DATA_SOURCES = [DATA_DIR, BACKEND_DATA_DIR]
 
 MAX_FILE_SIZE = 8 * 1024 * 1024  # 8 MB
+UPLOAD_COPY_BUFFER = 1 << 20
+FILES_CACHE_CONTROL = "public, max-age=60"
+LISTING_CACHE_CONTROL = "no-cache"  # always revalidate; the ETag makes that a cheap 304
 SUPPORTED_LANGS = {"en", "ru"}
 
 
@@ -70,51 +91,165 @@ class ContactMessage(BaseModel):
 
 
 class RateLimiter:
-    def __init__(self, limit: int, period_seconds: int) -> None:
-        self.limit = limit
-        self.period = period_seconds
-        self._hits: defaultdict[str, deque[float]] = defaultdict(deque)
-        self._lock = asyncio.Lock()
+    """Per-key token bucket; a single event loop owns the dict, so no lock is needed."""
+
+    def __init__(self, rate_per_sec: float, burst: int) -> None:
+        self.rate = rate_per_sec
+        self.burst = burst
+        # Once idle this long a bucket is full again and equivalent to a fresh one.
+        self.refill_seconds = burst / rate_per_sec
+        self._buckets: Dict[str, tuple[float, float]] = {}
+        self._next_sweep = time.monotonic() + self.refill_seconds
+
+    def _sweep(self, now: float) -> None:
+        cutoff = now - self.refill_seconds
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items() if bucket[1] > cutoff
+        }
+        self._next_sweep = now + self.refill_seconds
 
     async def consume(self, key: str) -> None:
         now = time.monotonic()
-        async with self._lock:
-            queue = self._hits[key]
-            while queue and now - queue[0] > self.period:
-                queue.popleft()
-            if len(queue) >= self.limit:
-                raise HTTPException(
-                    status_code=429, detail="Too many predictions. Please retry shortly."
-                )
-            queue.append(now)
+        if now >= self._next_sweep:
+            self._sweep(now)
+        tokens, last_seen = self._buckets.get(key, (float(self.burst), now))
+        tokens = min(self.burst, tokens + (now - last_seen) * self.rate)
+        if tokens < 1.0:
+            self._buckets[key] = (tokens, now)
+            raise HTTPException(
+                status_code=429, detail="Too many predictions. Please retry shortly."
+            )
+        self._buckets[key] = (tokens - 1.0, now)
+
+
+def _append_bytes(path: Path, data: bytes) -> None:
+    with path.open("ab") as handle:
+        handle.write(data)
+
+
+async def _append_bytes_async(path: Path, data: bytes) -> None:
+    async with aiofiles.open(path, "ab") as handle:
+        await handle.write(data)
 
 
 class EventLogger:
-    def __init__(self, artifacts_dir: Path) -> None:
+    """Queues event records in the request path and appends them from a background task."""
+
+    def __init__(
+        self, artifacts_dir: Path, batch_window: float = 0.1, max_pending: int = 10_000
+    ) -> None:
         self.artifacts_dir = artifacts_dir
-        self._lock = Lock()
+        self.batch_window = batch_window
+        self.max_pending = max_pending
+        # Created in start(): a queue binds to the event loop of its first use.
+        self._queue: asyncio.Queue[Dict[str, Any]] | None = None
+        self._consumer: asyncio.Task | None = None
+        self._cached_run_id: str | None = None
+        self._cached_metadata: Dict[str, Any] | None = None
+        # Log directories already created, so writes skip the mkdir syscalls.
+        self._log_dirs: set[Path] = set()
+
+    def invalidate_run_id(self) -> None:
+        self._cached_run_id = None
+        self._cached_metadata = None
 
     def _active_run_id(self) -> str:
-        metadata = yield_model.metadata or {}
-        run_id = metadata.get("run_id") or os.getenv("GEO_ACTIVE_RUN_ID")
+        metadata = yield_model.metadata
+        # A reload swaps the metadata dict, which also invalidates the cached id.
+        if self._cached_run_id is not None and metadata is self._cached_metadata:
+            return self._cached_run_id
+        run_id = (metadata or {}).get("run_id") or os.getenv("GEO_ACTIVE_RUN_ID")
         if run_id:
-            return str(run_id)
-        return f"run-live-{datetime.utcnow():%Y%m%d}"
+            self._cached_run_id = str(run_id)
+            self._cached_metadata = metadata
+            return self._cached_run_id
+        # The dated fallback rolls over at midnight, so it is never cached.
+        return f"run-live-{datetime.now(UTC):%Y%m%d}"
 
-    def log(self, event_type: str, payload: Dict[str, Any]) -> None:
-        run_id = self._active_run_id()
-        log_dir = self.artifacts_dir / run_id / "logs"
+    def _log_path(self, record: Dict[str, Any]) -> Path:
+        return self.artifacts_dir / record["run_id"] / "logs" / f"{record['event']}.log"
+
+    def _ensure_dir(self, log_dir: Path) -> None:
         log_dir.mkdir(parents=True, exist_ok=True)
+        self._log_dirs.add(log_dir)
+
+    def log(self, event_type: str, payload: Dict[str, Any]) -> None:
         record = {
             "event": event_type,
-            "run_id": run_id,
+            "run_id": self._active_run_id(),
             "logged_at": utc_now(),
             **payload,
         }
-        log_path = log_dir / f"{event_type}.log"
-        with self._lock:
-            with log_path.open("a", encoding="utf-8") as handle:
-                handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if self._queue is None:
+            # No running writer (before startup or after shutdown): append inline.
+            self._write_now(record)
+            return
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            # Spill to disk inline rather than dropping the event.
+            LOGGER.warning("Event queue full, writing %s event synchronously", event_type)
+            self._write_now(record)
+
+    def _write_now(self, record: Dict[str, Any]) -> None:
+        log_path = self._log_path(record)
+        if log_path.parent not in self._log_dirs:
+            self._ensure_dir(log_path.parent)
+        line = orjson.dumps(record) + b"\n"
+        try:
+            _append_bytes(log_path, line)
+        except FileNotFoundError:
+            # The run directory was removed after it was first created.
+            self._ensure_dir(log_path.parent)
+            _append_bytes(log_path, line)
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        grouped: defaultdict[Path, List[bytes]] = defaultdict(list)
+        for record in batch:
+            grouped[self._log_path(record)].append(orjson.dumps(record) + b"\n")
+        for log_path, lines in grouped.items():
+            if log_path.parent not in self._log_dirs:
+                await asyncio.to_thread(self._ensure_dir, log_path.parent)
+            try:
+                await _append_bytes_async(log_path, b"".join(lines))
+            except FileNotFoundError:
+                await asyncio.to_thread(self._ensure_dir, log_path.parent)
+                await _append_bytes_async(log_path, b"".join(lines))
+
+    async def _consume(self, queue: asyncio.Queue[Dict[str, Any]]) -> None:
+        while True:
+            batch = [await queue.get()]
+            await asyncio.sleep(self.batch_window)
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._flush(batch)
+            except Exception as exc:  # pragma: no cover - disk errors must not kill the writer
+                LOGGER.exception("Failed to persist %s events: %s", len(batch), exc)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    def start(self) -> None:
+        if self._consumer is not None and not self._consumer.done():
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._consumer = asyncio.create_task(self._consume(self._queue))
+
+    async def stop(self) -> None:
+        if self._consumer is None:
+            return
+        queue = self._queue
+        # Detach first so events logged while draining are written inline.
+        self._queue = None
+        if queue is not None and not self._consumer.done():
+            await queue.join()
+        self._consumer.cancel()
+        try:
+            await self._consumer
+        except asyncio.CancelledError:
+            pass
+        self._consumer = None
 
 
 RECOMMENDATIONS = {
@@ -158,11 +293,23 @@ TEXT_TRANSLATIONS = {
 }
 
 
+RECOMMENDATIONS_BY_LANG = {
+    (mode, lang): tips
+    for mode, by_lang in RECOMMENDATIONS.items()
+    for lang, tips in by_lang.items()
+    if tips
+}
+RECOMMENDATIONS_FALLBACK = {
+    mode: by_lang.get("en", []) for mode, by_lang in RECOMMENDATIONS.items()
+}
+
+
 def _client_key(request: Request) -> str:
     host = request.client.host if request.client else "anonymous"
     return host or "anonymous"
 
 
+@lru_cache(maxsize=64)
 def _normalize_lang(lang: str | None) -> str:
     if not lang:
         return "en"
@@ -171,16 +318,15 @@ def _normalize_lang(lang: str | None) -> str:
 
 
 def _translate_text(value: str, lang: str) -> str:
-    if lang == "ru":
-        return TEXT_TRANSLATIONS.get(value, value)
-    return value
+    return TEXT_TRANSLATIONS.get(value, value) if lang == "ru" else value
 
 
 def _inject_recommendations(payload: Dict[str, Any], lang: str) -> Dict[str, Any]:
     mode = payload.get("mode")
     payload["lang"] = lang
-    recommendations = RECOMMENDATIONS.get(mode or "", {})
-    payload["recommendations"] = recommendations.get(lang) or recommendations.get("en") or []
+    payload["recommendations"] = RECOMMENDATIONS_BY_LANG.get(
+        (mode, lang), RECOMMENDATIONS_FALLBACK.get(mode, [])
+    )
     if "fertilizer_suggestion" in payload:
         payload["fertilizer_suggestion_localized"] = _translate_text(
             payload["fertilizer_suggestion"], lang
@@ -189,7 +335,12 @@ def _inject_recommendations(payload: Dict[str, Any], lang: str) -> Dict[str, Any
 
 
 def _find_data_file(filename: str) -> Optional[Path]:
-    safe_name = Path(filename).name
+    return _find_data_file_cached(Path(filename).name, directory_fingerprint(DATA_SOURCES))
+
+
+@lru_cache(maxsize=256)
+def _find_data_file_cached(safe_name: str, fingerprint: tuple) -> Optional[Path]:
+    # fingerprint only keys the cache: adding or removing files bumps a directory mtime.
     for directory in DATA_SOURCES:
         candidate = directory / safe_name
         if candidate.exists() and candidate.is_file():
@@ -197,10 +348,70 @@ def _find_data_file(filename: str) -> Optional[Path]:
     return None
 
 
-rate_limiter = RateLimiter(limit=40, period_seconds=60)
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def _not_modified_since(request: Request, mtime: float) -> bool:
+    header = request.headers.get("if-modified-since")
+    if not header or "if-none-match" in request.headers:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since.timestamp()
+
+
+async def _read_upload(file: UploadFile) -> bytes:
+    size = file.size if file.size is not None else _upload_size(file.file)
+    if size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="File exceeds 8MB limit")
+    return await file.read()
+
+
+def _upload_size(source: IO[bytes]) -> int:
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def _copy_upload(source: IO[bytes], destination: Path, size: int) -> None:
+    # Uploads past the multipart spool threshold already live in a temp file on disk,
+    # so the kernel can copy them directly; in-memory spools go through a 1 MiB buffer.
+    on_disk = not isinstance(source, SpooledTemporaryFile) or size > MultiPartParser.max_file_size
+    offset = 0
+    with destination.open("wb") as target:
+        if on_disk and hasattr(os, "sendfile"):
+            try:
+                source_fd = source.fileno()
+            except (AttributeError, OSError, ValueError):
+                source_fd = None
+            if source_fd is not None:
+                while offset < size:
+                    sent = os.sendfile(target.fileno(), source_fd, offset, size - offset)
+                    if not sent:
+                        break
+                    offset += sent
+                if offset == size:
+                    return
+                # sendfile stopped early; finish with a buffered copy from the same offset.
+                target.seek(offset)
+        source.seek(offset)
+        shutil.copyfileobj(source, target, UPLOAD_COPY_BUFFER)
+
+
+rate_limiter = RateLimiter(rate_per_sec=40 / 60, burst=40)
 event_logger = EventLogger(ARTIFACTS_DIR)
 
-app = FastAPI(title="GeoPortal API", version="2.1.0")
+app = FastAPI(title="GeoPortal API", version="2.1.0", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -215,11 +426,27 @@ app.add_middleware(
 async def _load_models() -> None:
     disease_model.load()
     yield_model.load()
+    event_logger.invalidate_run_id()
+
+
+@app.on_event("startup")
+async def _start_background_workers() -> None:
+    event_logger.start()
+    if disease_model.batcher is not None:
+        disease_model.batcher.start()
+
+
+@app.on_event("shutdown")
+async def _stop_background_workers() -> None:
+    if disease_model.batcher is not None:
+        await disease_model.batcher.stop()
+    await event_logger.stop()
 
 
 @app.get("/api/hello")
-async def hello() -> dict:
-    return {"status": "ok", "timestamp": utc_now()}
+async def hello() -> ORJSONResponse:
+    # Liveness probe: skip response-model validation and encode straight with orjson.
+    return ORJSONResponse({"status": "ok", "timestamp": utc_now()})
 
 
 @app.post("/api/hello")
@@ -241,28 +468,26 @@ async def submit_contact(payload: ContactMessage) -> dict:
 async def upload_image(file: UploadFile = File(...)) -> dict:
     if not file.filename:
         raise HTTPException(status_code=400, detail="Filename missing")
-    contents = await file.read()
-    if not contents:
-        raise HTTPException(status_code=400, detail="Empty file")
-    if len(contents) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=413, detail="File exceeds 8MB limit")
     suffix = Path(file.filename).suffix or ".bin"
     safe_suffix = suffix if len(suffix) <= 10 else suffix[:10]
-    generated_name = (
-        f"{datetime.utcnow():%Y%m%d_%H%M%S}_{secrets.token_hex(4)}{safe_suffix}"
-    )
+    now = datetime.now(UTC)
+    generated_name = f"{now:%Y%m%d_%H%M%S}_{os.urandom(4).hex()}{safe_suffix}"
     destination = UPLOAD_DIR / generated_name
-    with destination.open("wb") as buffer:
-        buffer.write(contents)
+    size = _upload_size(file.file)
+    if size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="File exceeds 8MB limit")
+    if not size:
+        raise HTTPException(status_code=400, detail="Empty file")
+    await asyncio.to_thread(_copy_upload, file.file, destination, size)
     event_logger.log(
         "upload",
-        {"filename": generated_name, "original_name": file.filename, "size_bytes": len(contents)},
+        {"filename": generated_name, "original_name": file.filename, "size_bytes": size},
     )
     return {
         "filename": generated_name,
         "original_name": file.filename,
-        "uploaded_at": utc_now(),
-        "size_bytes": destination.stat().st_size,
+        "uploaded_at": utc_now(now),
+        "size_bytes": size,
     }
 
 
@@ -281,12 +506,10 @@ async def predict(
                 status_code=415,
                 detail="Image predictions require multipart/form-data",
             )
-        image_bytes = await file.read()
+        image_bytes = await _read_upload(file)
         if not image_bytes:
             raise HTTPException(status_code=400, detail="Empty file")
-        if len(image_bytes) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="File exceeds 8MB limit")
-        result = disease_model.predict_from_bytes(image_bytes)
+        result = await disease_model.predict_from_bytes_async(image_bytes)
         result["filename"] = file.filename
         result["received_bytes"] = len(image_bytes)
         _inject_recommendations(result, language)
@@ -308,14 +531,14 @@ async def predict(
             detail="Yield predictions require application/json payloads",
         )
     try:
-        body = await request.json()
-    except Exception as exc:  # pragma: no cover - JSON parsing edge
-        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {exc}") from exc
-
-    try:
-        payload = YieldFeaturePayload(**body)
+        payload = YieldFeaturePayload.model_validate_json(await request.body())
     except ValidationError as err:
-        raise HTTPException(status_code=422, detail=json.loads(err.json())) from err
+        errors = json.loads(err.json())
+        if any(error.get("type") == "json_invalid" for error in errors):
+            raise HTTPException(
+                status_code=400, detail=f"Invalid JSON body: {errors[0].get('msg')}"
+            ) from err
+        raise HTTPException(status_code=422, detail=errors) from err
     features = payload.model_dump()
     prediction = yield_model.predict_from_features(features)
     prediction["input_features"] = features
@@ -340,8 +563,21 @@ async def models_status() -> dict:
 
 
 @app.get("/api/files")
-async def list_files(extensions: Optional[List[str]] = Query(default=None)) -> List[dict]:
+async def list_files(
+    request: Request,
+    response: Response,
+    extensions: Optional[List[str]] = Query(default=None),
+) -> List[dict]:
     assets = list_data_assets(DATA_SOURCES, extensions)
+    fingerprint = "\n".join(
+        f"{asset['source']}/{asset['filename']}:{asset['modified_at']}:{asset['size_kb']}"
+        for asset in assets
+    )
+    etag = f'W/"{hashlib.blake2b(fingerprint.encode(), digest_size=8).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": LISTING_CACHE_CONTROL}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     return [
         {
             "filename": asset["filename"],
@@ -363,12 +599,27 @@ MEDIA_TYPES = {
 
 
 @app.get("/api/files/{filename}")
-async def download_file(filename: str):
+async def download_file(filename: str, request: Request):
     file_path = _find_data_file(filename)
     if not file_path:
         raise HTTPException(status_code=404, detail="File not found")
+    stat = file_path.stat()
+    etag = f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": FILES_CACHE_CONTROL,
+    }
+    if _etag_matches(request, etag) or _not_modified_since(request, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
     media_type = MEDIA_TYPES.get(file_path.suffix.lower(), "application/octet-stream")
-    return FileResponse(path=file_path, media_type=media_type, filename=file_path.name)
+    return FileResponse(
+        path=file_path,
+        media_type=media_type,
+        filename=file_path.name,
+        headers=headers,
+        stat_result=stat,
+    )
 
 
 @app.get("/api/dashboard/metrics")
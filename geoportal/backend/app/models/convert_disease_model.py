@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import argparse
+import logging
+from pathlib import Path
+
+LOGGER = logging.getLogger("convert_disease_model")
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+ML_MODEL_DIR = BACKEND_DIR / "ml_model"
+
+
+def export_onnx(keras_path: Path, output_path: Path, opset: int = 17) -> Path:
+    try:
+        import onnx  # type: ignore
+        import tensorflow as tf  # type: ignore
+        import tf2onnx  # type: ignore
+    except ImportError as exc:  # pragma: no cover - offline tooling only
+        raise SystemExit(
+            f"Conversion requires tensorflow, tf2onnx and onnx to be installed: {exc}"
+        ) from exc
+
+    model = tf.keras.models.load_model(keras_path)
+    signature = (tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name="input"),)
+    model_proto, _ = tf2onnx.convert.from_keras(model, input_signature=signature, opset=opset)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    onnx.save(model_proto, str(output_path))
+    LOGGER.info("Exported %s to %s (opset %s)", keras_path, output_path, opset)
+    return output_path
+
+
+def quantize_int8(source_path: Path, output_path: Path) -> Path:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(source_path), str(output_path), weight_type=QuantType.QInt8)
+    LOGGER.info("Wrote INT8 dynamically quantized model to %s", output_path)
+    return output_path
+
+
+def convert(keras_path: Path, output_path: Path, opset: int = 17, quantize: bool = True) -> Path:
+    if not keras_path.exists():
+        raise FileNotFoundError(f"Keras disease model not found: {keras_path}")
+    if not quantize:
+        return export_onnx(keras_path, output_path, opset=opset)
+    fp32_path = output_path.with_suffix(".fp32.onnx")
+    export_onnx(keras_path, fp32_path, opset=opset)
+    return quantize_int8(fp32_path, output_path)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Convert the Keras disease model to ONNX.")
+    parser.add_argument("--source", type=Path, default=ML_MODEL_DIR / "plant_model.h5")
+    parser.add_argument("--output", type=Path, default=ML_MODEL_DIR / "plant_model.onnx")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset version")
+    parser.add_argument(
+        "--no-quantize", action="store_true", help="Keep FP32 weights instead of INT8"
+    )
+    parser.add_argument("--verbose", action="store_true", help="Enable debug logs")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+    )
+    output = convert(args.source, args.output, opset=args.opset, quantize=not args.no_quantize)
+    LOGGER.info("Disease model ready for onnxruntime at %s", output)
+
+
+if __name__ == "__main__":
+    main()
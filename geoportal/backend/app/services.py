@@ -1,12 +1,20 @@
 from __future__ import annotations
 
-import json
-import math
+import copy
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
 from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Sequence
 
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 CROP_ALIASES = {
     "wheat": "cereals, primary",
@@ -47,11 +55,34 @@ FERTILIZER_TARGETS = {
 }
 
 
+SNAPSHOT_COLUMNS = ["year", "crop_type", "area_harvested_ha", "production_t", "yield_kg_per_ha"]
+TRAINING_CSV_TYPES = {
+    "crop_type": pa.string(),
+    "area_harvested_ha": pa.float64(),
+    "production_t": pa.float64(),
+    "yield_kg_per_ha": pa.float64(),
+}
+# Parquet splits carry a categorical crop_type and Arrow-backed measures while CSV and
+# Feather come back as NumPy; every loader is normalised to this one schema.
+TRAINING_FRAME_DTYPES = {
+    "crop_type": "object",
+    "area_harvested_ha": "float64",
+    "production_t": "float64",
+    "yield_kg_per_ha": "float64",
+}
+
+ASSETS_CACHE_TTL = 5.0  # seconds
+ASSETS_CACHE_SIZE = 32  # extension filters come from the query string, so keep the LRU small
+_assets_cache: OrderedDict[tuple, tuple[float, tuple, List[dict]]] = OrderedDict()
+
+
+@lru_cache(maxsize=512)
 def _friendly_label(value: str) -> str:
     cleaned = value.replace("__", " ").replace("_", " ").replace(",", ", ")
     return " ".join(word.capitalize() for word in cleaned.split())
 
 
+@lru_cache(maxsize=512)
 def _region_for_crop(value: str) -> str:
     return REGION_LOOKUP.get(value.lower(), "Kazakhstan National")
 
@@ -59,32 +90,123 @@ def _region_for_crop(value: str) -> str:
 def _latest_run_dir(artifacts_dir: Path) -> Optional[Path]:
     if not artifacts_dir.exists():
         return None
-    candidates = [
-        path for path in artifacts_dir.iterdir() if path.is_dir() and path.name.startswith("run-")
-    ]
-    if not candidates:
+    with os.scandir(artifacts_dir) as scan:
+        latest = max(
+            (entry for entry in scan if entry.name.startswith("run-") and entry.is_dir()),
+            key=lambda entry: entry.stat().st_mtime,
+            default=None,
+        )
+    return Path(latest.path) if latest else None
+
+
+def _training_source(run_dir: Optional[Path]) -> Optional[Path]:
+    if run_dir is None:
         return None
-    candidates.sort(key=lambda item: item.stat().st_mtime, reverse=True)
-    return candidates[0]
+    parquet_path = run_dir / "data" / "train.parquet"
+    if parquet_path.exists():
+        return parquet_path
+    # Runs prepared before the switch to Parquet only ship CSV splits.
+    csv_path = run_dir / "data" / "train.csv"
+    return csv_path if csv_path.exists() else None
 
 
-@lru_cache(maxsize=2)
 def _load_training_frame(artifacts_dir: Path) -> tuple[Optional[str], pd.DataFrame]:
     run_dir = _latest_run_dir(artifacts_dir)
     if not run_dir:
         return None, pd.DataFrame()
-    csv_path = run_dir / "data" / "train.csv"
-    if not csv_path.exists():
-        return run_dir.name, pd.DataFrame()
-    df = pd.read_csv(csv_path)
-    return run_dir.name, df
+    source = _training_source(run_dir)
+    return run_dir.name, _read_training_frame(source, _mtime_ns(source))
+
+
+@lru_cache(maxsize=2)
+def _read_training_frame(source: Optional[Path], mtime_ns: Optional[int]) -> pd.DataFrame:
+    # mtime_ns only keys the cache: a newer run or a rewritten split loads afresh.
+    if source is None or mtime_ns is None:
+        return pd.DataFrame()
+    if source.suffix == ".parquet":
+        return _prepare_frame(pd.read_parquet(source, columns=SNAPSHOT_COLUMNS))
+    return _prepare_frame(_read_training_csv(source))
+
+
+def _read_training_csv(csv_path: Path) -> pd.DataFrame:
+    # The CSV is parsed once; later cold loads read the Feather sidecar written beside it.
+    sidecar = csv_path.with_suffix(".feather")
+    try:
+        if sidecar.stat().st_mtime >= csv_path.stat().st_mtime:
+            return pd.read_feather(sidecar)
+    except (OSError, ValueError, pa.ArrowInvalid):
+        pass  # missing, stale or unreadable sidecar: reparse the CSV and rewrite it
+    # pyarrow parses in parallel; _prepare_frame aligns the dtypes with the Parquet path.
+    convert_options = pacsv.ConvertOptions(
+        column_types=TRAINING_CSV_TYPES, include_columns=SNAPSHOT_COLUMNS
+    )
+    df = pacsv.read_csv(csv_path, convert_options=convert_options).to_pandas()
+    _write_sidecar(df, sidecar)
+    return df
+
+
+def _write_sidecar(df: pd.DataFrame, sidecar: Path) -> None:
+    # Written beside the target and renamed over it, so readers never see a partial file.
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=sidecar.parent, prefix=f".{sidecar.name}.")
+    except OSError:
+        return  # read-only artifacts: keep serving from the CSV
+    os.close(fd)
+    try:
+        df.to_feather(tmp_name)
+        os.replace(tmp_name, sidecar)
+    except OSError:
+        Path(tmp_name).unlink(missing_ok=True)
+
+
+def _prepare_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Attach categorical region/crop_label keys shared by every dashboard and history view.
+
+    Both string maps run once per distinct crop at load time, never per request.
+    """
+    df = df.astype(TRAINING_FRAME_DTYPES)
+    crop_types = df["crop_type"]
+    uniques = crop_types.unique()
+    regions = crop_types.map({value: _region_for_crop(value) for value in uniques})
+    labels = crop_types.map({value: _friendly_label(value) for value in uniques})
+    return df.assign(region=regions.astype("category"), crop_label=labels.astype("category"))
+
+
+def _matches_category(values: pd.Series, needle: str) -> np.ndarray:
+    """Case-insensitive equality, evaluated once per category and broadcast through the codes."""
+    hits = np.append(values.cat.categories.str.lower() == needle, False)
+    return hits[values.cat.codes.to_numpy()]
+
+
+def _mtime_ns(path: Optional[Path]) -> Optional[int]:
+    if path is None:
+        return None
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
 
 
 def _read_json(path: Path) -> Dict[str, Any]:
-    if not path.exists():
+    # Parsed once per file version; callers only read the result.
+    return _read_json_cached(path, _mtime_ns(path))
+
+
+@lru_cache(maxsize=16)
+def _read_json_cached(path: Path, mtime_ns: Optional[int]) -> Dict[str, Any]:
+    if mtime_ns is None:
         return {}
-    with path.open("r", encoding="utf-8") as handle:
-        return json.load(handle)
+    return orjson.loads(path.read_bytes())
+
+
+def directory_fingerprint(directories: Sequence[Path]) -> tuple:
+    fingerprint = []
+    for directory in directories:
+        try:
+            fingerprint.append(directory.stat().st_mtime_ns if directory else None)
+        except OSError:
+            fingerprint.append(None)
+    return tuple(fingerprint)
 
 
 def list_data_assets(
@@ -92,41 +214,67 @@ def list_data_assets(
     extensions: Optional[Iterable[str]] = None,
 ) -> List[dict]:
     normalized_exts = (
-        {ext.lower().lstrip(".") for ext in extensions} if extensions else {"csv", "xlsx"}
+        frozenset(ext.lower().lstrip(".") for ext in extensions)
+        if extensions
+        else frozenset({"csv", "xlsx"})
     )
+    key = (tuple(str(directory) for directory in directories), normalized_exts)
+    fingerprint = directory_fingerprint(directories)
+    now = time.monotonic()
+    cached = _assets_cache.get(key)
+    if cached and now - cached[0] < ASSETS_CACHE_TTL and cached[1] == fingerprint:
+        _assets_cache.move_to_end(key)
+        return cached[2]
+    entries = _scan_data_assets(directories, normalized_exts)
+    _assets_cache[key] = (now, fingerprint, entries)
+    _assets_cache.move_to_end(key)
+    while len(_assets_cache) > ASSETS_CACHE_SIZE:
+        _assets_cache.popitem(last=False)
+    return entries
+
+
+def _utc_isoformat(timestamp: float) -> str:
+    moment = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return moment.isoformat(timespec="microseconds").replace("+00:00", "Z")
+
+
+def _scan_data_assets(directories: Sequence[Path], normalized_exts: frozenset) -> List[dict]:
     entries: List[dict] = []
     for directory in directories:
         if not directory or not directory.exists():
             continue
-        for path in sorted(directory.glob("*")):
-            if not path.is_file():
-                continue
-            ext = path.suffix.lower().lstrip(".")
-            if ext not in normalized_exts:
-                continue
-            stat = path.stat()
-            try:
-                parent_anchor = directory.parents[1]
-                source = str(directory.relative_to(parent_anchor))
-            except (IndexError, ValueError):
-                source = str(directory)
-            entries.append(
-                {
-                    "filename": path.name,
-                    "display_name": _friendly_label(path.stem),
-                    "extension": ext,
-                    "size_kb": round(stat.st_size / 1024, 2),
-                    "modified_at": stat.st_mtime,
-                    "modified_iso": pd.to_datetime(stat.st_mtime, unit="s").isoformat(),
-                    "source": source,
-                    "download_url": f"/api/files/{path.name}",
-                }
-            )
+        try:
+            source = str(directory.relative_to(directory.parents[1]))
+        except (IndexError, ValueError):
+            source = str(directory)
+        # The final sort by filename makes a per-directory sort redundant.
+        with os.scandir(directory) as scan:
+            for entry in scan:
+                name = entry.name
+                if name.startswith("."):
+                    continue
+                stem, dot, ext = name.rpartition(".")
+                ext = ext.lower()
+                if not dot or ext not in normalized_exts or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries.append(
+                    {
+                        "filename": name,
+                        "display_name": _friendly_label(stem),
+                        "extension": ext,
+                        "size_kb": round(stat.st_size / 1024, 2),
+                        "modified_at": stat.st_mtime,
+                        "modified_iso": _utc_isoformat(stat.st_mtime),
+                        "source": source,
+                        "download_url": f"/api/files/{name}",
+                    }
+                )
     entries.sort(key=lambda item: item["filename"])
     return entries
 
 
-def _synthetic_series() -> List[dict]:
+def _build_synthetic_series() -> List[dict]:
     base_regions = list(REGION_CLIMATE.keys())
     years = list(range(2014, 2025))
     payload = []
@@ -144,27 +292,51 @@ def _synthetic_series() -> List[dict]:
     return payload
 
 
-def _line_series(frame: pd.DataFrame) -> List[dict]:
+# Neither payload depends on request input, so both are built once at import.
+_SYNTHETIC_SERIES = tuple(_build_synthetic_series())
+
+
+_SYNTHETIC_FILTERS = {
+    "regions": sorted({entry["region"] for entry in _SYNTHETIC_SERIES}),
+    "crop_types": sorted({entry["crop_type"] for entry in _SYNTHETIC_SERIES}),
+    "years": sorted({entry["year"] for entry in _SYNTHETIC_SERIES}),
+}
+
+
+def _synthetic_series() -> List[dict]:
+    return list(_SYNTHETIC_SERIES)
+
+
+def _line_series(frame: pd.DataFrame) -> tuple[List[dict], Dict[str, list]]:
+    """Yearly mean yield per region/crop, plus the sorted filter values it contains."""
     if frame.empty:
-        return _synthetic_series()
-    working = frame.copy()
-    working = working.dropna(subset=["year", "yield_kg_per_ha"])
-    working["region"] = working["crop_type"].apply(_region_for_crop)
-    working["crop_label"] = working["crop_type"].apply(_friendly_label)
+        return _synthetic_series(), copy.deepcopy(_SYNTHETIC_FILTERS)
+    working = frame[["year", "region", "crop_label", "yield_kg_per_ha"]].dropna(
+        subset=["year", "yield_kg_per_ha"]
+    )
+    # Categorical keys group on integer codes; observed=True skips unseen combinations.
     grouped = (
-        working.groupby(["year", "region", "crop_label"], as_index=False)["yield_kg_per_ha"]
+        working.groupby(["year", "region", "crop_label"], sort=False, observed=True)[
+            "yield_kg_per_ha"
+        ]
         .mean()
-        .sort_values(["year", "region"])
+        .reset_index()
+        .sort_values(["year", "region", "crop_label"])
     )
-    return [
-        {
-            "year": int(row.year),
-            "region": row.region,
-            "crop_type": row.crop_label,
-            "yield": round(float(row.yield_kg_per_ha), 2),
-        }
-        for row in grouped.to_dict("records")
+    years = grouped["year"].to_numpy().astype(np.int64)
+    region_values = grouped["region"].to_numpy()
+    label_values = grouped["crop_label"].to_numpy()
+    yields = np.round(grouped["yield_kg_per_ha"].to_numpy(), 2)
+    series = [
+        {"year": int(year), "region": region, "crop_type": label, "yield": float(value)}
+        for year, region, label, value in zip(years, region_values, label_values, yields)
     ]
+    filters = {
+        "regions": np.unique(region_values).tolist(),
+        "crop_types": np.unique(label_values).tolist(),
+        "years": np.unique(years).tolist(),
+    }
+    return series, filters
 
 
 def _rmse_mae(metadata: Dict[str, Any]) -> List[dict]:
@@ -191,9 +363,15 @@ def _rmse_mae(metadata: Dict[str, Any]) -> List[dict]:
 
 
 def _disease_distribution(models_dir: Path) -> List[dict]:
-    labels = _read_json(models_dir / "disease_labels.json") or []
+    labels_path = models_dir / "disease_labels.json"
+    return list(_disease_distribution_cached(labels_path, _mtime_ns(labels_path)))
+
+
+@lru_cache(maxsize=4)
+def _disease_distribution_cached(labels_path: Path, mtime_ns: Optional[int]) -> tuple:
+    labels = _read_json(labels_path) or []
     if not isinstance(labels, list):
-        return []
+        return ()
     buckets: Dict[str, int] = {}
     for raw in labels:
         if not isinstance(raw, str):
@@ -203,13 +381,13 @@ def _disease_distribution(models_dir: Path) -> List[dict]:
         friendly = _friendly_label(disease)
         buckets[friendly] = buckets.get(friendly, 0) + 1
     total = sum(buckets.values()) or 1
-    return [
+    return tuple(
         {"label": name, "value": value, "percentage": round((value / total) * 100, 2)}
         for name, value in sorted(buckets.items(), key=lambda item: item[1], reverse=True)
-    ]
+    )
 
 
-def _fertilizer_mix() -> List[dict]:
+def _build_fertilizer_mix() -> List[dict]:
     components = [
         ("Nitrogen efficiency", 32),
         ("Balanced NPK", 27),
@@ -224,41 +402,68 @@ def _fertilizer_mix() -> List[dict]:
     ]
 
 
+_FERTILIZER_MIX = tuple(_build_fertilizer_mix())
+
+
+def _fertilizer_mix() -> List[dict]:
+    return list(_FERTILIZER_MIX)
+
+
+def _rounded_or_none(values: pd.Series) -> List[Optional[float]]:
+    """Round to 2 dp in one vectorized pass and map NaN to None for JSON."""
+    return values.round(2).astype(object).where(values.notna(), None).tolist()
+
+
 def _table_snapshot(frame: pd.DataFrame, limit: int = 12) -> List[dict]:
     if frame.empty:
         return []
-    subset = frame.copy()
-    subset["region"] = subset["crop_type"].apply(_region_for_crop)
-    subset["crop_label"] = subset["crop_type"].apply(_friendly_label)
-    subset = subset.sort_values("year", ascending=False).head(limit)
+    subset = frame.sort_values("year", ascending=False).head(limit)
     return [
         {
-            "year": int(row.year),
-            "region": row.region,
-            "crop_type": row.crop_label,
-            "area_harvested_ha": round(float(row.area_harvested_ha), 2)
-            if not math.isnan(row.area_harvested_ha)
-            else None,
-            "production_t": round(float(row.production_t), 2)
-            if not math.isnan(row.production_t)
-            else None,
-            "yield": round(float(row.yield_kg_per_ha), 2)
-            if not math.isnan(row.yield_kg_per_ha)
-            else None,
+            "year": int(year),
+            "region": region,
+            "crop_type": label,
+            "area_harvested_ha": area,
+            "production_t": production,
+            "yield": value,
         }
-        for row in subset.itertuples()
+        for year, region, label, area, production, value in zip(
+            subset["year"].to_numpy(),
+            subset["region"].to_numpy(),
+            subset["crop_label"].to_numpy(),
+            _rounded_or_none(subset["area_harvested_ha"]),
+            _rounded_or_none(subset["production_t"]),
+            _rounded_or_none(subset["yield_kg_per_ha"]),
+        )
     ]
 
 
+def _dashboard_fingerprint(artifacts_dir: Path, models_dir: Path) -> tuple:
+    run_dir = _latest_run_dir(artifacts_dir)
+    source = _training_source(run_dir)
+    return (
+        run_dir.name if run_dir else None,
+        source,
+        _mtime_ns(source),
+        _mtime_ns(models_dir / "yield_metadata.json"),
+        _mtime_ns(models_dir / "disease_labels.json"),
+    )
+
+
 def build_dashboard_metrics(artifacts_dir: Path, models_dir: Path) -> Dict[str, Any]:
+    fingerprint = _dashboard_fingerprint(artifacts_dir, models_dir)
+    # Hand out copies so callers cannot mutate the cached payload.
+    return copy.deepcopy(_build_dashboard_metrics_cached(artifacts_dir, models_dir, fingerprint))
+
+
+@lru_cache(maxsize=4)
+def _build_dashboard_metrics_cached(
+    artifacts_dir: Path, models_dir: Path, fingerprint: tuple
+) -> Dict[str, Any]:
+    # fingerprint only keys the cache: a new run or retrained model changes it.
     run_id, frame = _load_training_frame(artifacts_dir)
     metadata = _read_json(models_dir / "yield_metadata.json")
-    line_series = _line_series(frame)
-    filters = {
-        "regions": sorted({entry["region"] for entry in line_series}),
-        "crop_types": sorted({entry["crop_type"] for entry in line_series}),
-        "years": sorted({entry["year"] for entry in line_series}),
-    }
+    line_series, filters = _line_series(frame)
     return {
         "run_id": metadata.get("run_id") or run_id,
         "generated_at": metadata.get("generated_at"),
@@ -292,8 +497,15 @@ def _suggested_from_history(history: List[dict], region: str, crop_type: str) ->
             "area_change_rate": 0.0,
             "yield_change_rate": 0.0,
         }
-    avg_area = sum(item.get("area_harvested_ha", 0) or 0 for item in history) / len(history)
-    avg_prod = sum(item.get("production_t", 0) or 0 for item in history) / len(history)
+    count = len(history)
+    areas = np.fromiter(
+        (item.get("area_harvested_ha") or 0 for item in history), dtype=np.float64, count=count
+    )
+    productions = np.fromiter(
+        (item.get("production_t") or 0 for item in history), dtype=np.float64, count=count
+    )
+    avg_area = float(areas.mean())
+    avg_prod = float(productions.mean())
     base_year = history[0].get("year") or pd.Timestamp.utcnow().year
     climate = _climate_defaults(region)
     area_change = 0.0
@@ -301,10 +513,10 @@ def _suggested_from_history(history: List[dict], region: str, crop_type: str) ->
     if len(history) >= 2:
         previous = history[1]
         current = history[0]
-        prev_area = previous.get("area_harvested_ha") or 0
+        prev_area = areas[1]
         prev_yield = previous.get("yield") or 0
         if prev_area:
-            area_change = round(((current.get("area_harvested_ha") or 0) - prev_area) / prev_area, 4)
+            area_change = round(float((areas[0] - prev_area) / prev_area), 4)
         if prev_yield:
             yield_change = round(((current.get("yield") or 0) - prev_yield) / prev_yield, 4)
     return {
@@ -342,32 +554,31 @@ def yield_history_payload(
                 "crop_types": ["Wheat", "Corn", "Rice", "Potato"],
             },
         }
-    working = frame.copy()
-    working["region"] = working["crop_type"].apply(_region_for_crop)
-    working["crop_label"] = working["crop_type"].apply(_friendly_label)
+    mask = np.ones(len(frame), dtype=bool)
     if crop_type:
         norm = crop_type.strip().lower()
         norm = CROP_ALIASES.get(norm, norm)
-        working = working[working["crop_label"].str.lower() == norm]
+        mask &= _matches_category(frame["crop_label"], norm)
     if region:
-        working = working[working["region"].str.lower() == region.strip().lower()]
-    working = working.sort_values("year", ascending=False).head(limit)
+        mask &= _matches_category(frame["region"], region.strip().lower())
+    working = frame.loc[mask].sort_values("year", ascending=False).head(limit)
     history = [
         {
-            "year": int(row.year),
-            "region": row.region,
-            "crop_type": row.crop_label,
-            "yield": round(float(row.yield_kg_per_ha), 2)
-            if not math.isnan(row.yield_kg_per_ha)
-            else None,
-            "area_harvested_ha": round(float(row.area_harvested_ha), 2)
-            if not math.isnan(row.area_harvested_ha)
-            else None,
-            "production_t": round(float(row.production_t), 2)
-            if not math.isnan(row.production_t)
-            else None,
+            "year": int(year),
+            "region": region_value,
+            "crop_type": label,
+            "yield": value,
+            "area_harvested_ha": area,
+            "production_t": production,
         }
-        for row in working.itertuples()
+        for year, region_value, label, value, area, production in zip(
+            working["year"].to_numpy(),
+            working["region"].to_numpy(),
+            working["crop_label"].to_numpy(),
+            _rounded_or_none(working["yield_kg_per_ha"]),
+            _rounded_or_none(working["area_harvested_ha"]),
+            _rounded_or_none(working["production_t"]),
+        )
     ]
     region_name = history[0]["region"] if history else region or "Kazakhstan National"
     crop_label = history[0]["crop_type"] if history else (crop_type or "Wheat")
@@ -375,9 +586,10 @@ def yield_history_payload(
         "run_id": run_id,
         "history": history,
         "suggested_features": _suggested_from_history(history, region_name, crop_label),
+        # Categories of the load-time keys are already the sorted distinct values.
         "available": {
-            "regions": sorted(set(frame["crop_type"].map(_region_for_crop))),
-            "crop_types": sorted({_friendly_label(value) for value in frame["crop_type"].unique()}),
-            "years": sorted({int(year) for year in frame["year"].dropna().unique()}),
+            "regions": frame["region"].cat.categories.tolist(),
+            "crop_types": frame["crop_label"].cat.categories.tolist(),
+            "years": np.unique(frame["year"].dropna().to_numpy().astype(np.int64)).tolist(),
         },
     }
@@ -5,10 +5,7 @@ import json
 import logging
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List
-
-import matplotlib.pyplot as plt
-import seaborn as sns
+from typing import Any, Dict, List, Tuple
 
 LOGGER = logging.getLogger("plot_metrics")
 
@@ -41,7 +38,18 @@ def ensure_plots_dir(run_dir: Path) -> Path:
     return plots_dir
 
 
+def _plotting_modules() -> Tuple[Any, Any]:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    return plt, sns
+
+
 def plot_disease_history(history: Dict[str, List[float]], destination: Path) -> None:
+    plt, sns = _plotting_modules()
     sns.set_theme(style="whitegrid")
     epochs = history.get("epochs") or list(range(1, len(history.get("accuracy", [])) + 1))
     plt.figure(figsize=(8, 4))
@@ -71,6 +79,7 @@ def plot_disease_history(history: Dict[str, List[float]], destination: Path) ->
 
 
 def plot_yield_metrics(metadata: Dict, destination: Path) -> None:
+    plt, sns = _plotting_modules()
     metrics = metadata.get("metrics", {})
     names = []
     rmse = []
@@ -105,11 +114,14 @@ def plot_yield_metrics(metadata: Dict, destination: Path) -> None:
 def synthetic_history(epochs: int = 10) -> Dict[str, List[float]]:
     import numpy as np
 
+    rng = np.random.default_rng()
+    noise = rng.uniform(0, 0.1, size=(2, epochs))
+    noise[0] *= 0.2
     epoch_axis = list(range(1, epochs + 1))
     acc = np.linspace(0.55, 0.94, epochs)
-    val_acc = np.linspace(0.5, 0.9, epochs) - np.random.uniform(0, 0.02, epochs)
+    val_acc = np.linspace(0.5, 0.9, epochs) - noise[0]
     loss = np.linspace(1.2, 0.2, epochs)
-    val_loss = loss + np.random.uniform(0, 0.1, epochs)
+    val_loss = loss + noise[1]
     return {
         "epochs": epoch_axis,
         "accuracy": acc.tolist(),
@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+from io import BytesIO
+
 import pytest
 from fastapi.testclient import TestClient
+from PIL import Image
 
 from app.main import app, disease_model, yield_model
 
@@ -12,3 +15,10 @@ def client():
     yield_model.load = lambda: None  # type: ignore[assignment]
     with TestClient(app) as test_client:
         yield test_client
+
+
+@pytest.fixture(scope="session")
+def sample_png_bytes() -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (16, 16), color=(255, 0, 0)).save(buffer, format="PNG")
+    return buffer.getvalue()
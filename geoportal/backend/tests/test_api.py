@@ -1,10 +1,57 @@
 from __future__ import annotations
 
-from io import BytesIO
+import asyncio
+import json
+import os
+import re
+import shutil
+from datetime import datetime, timezone
 
-from PIL import Image
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
 
-from app.main import DATA_DIR, disease_model, yield_model
+from app import main, services
+from app.data_prep.yield_prep import _pct_change_by_group
+from app.main import (
+    DATA_DIR,
+    MAX_FILE_SIZE,
+    EventLogger,
+    RateLimiter,
+    app,
+    disease_model,
+    yield_model,
+)
+from app.ml_model import DiseaseModel, InferenceBatcher, YieldModel
+
+
+def _training_rows(yield_value: float) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "year": [2020, 2021],
+            "crop_type": ["cereals,_primary", "arable_land"],
+            "area_harvested_ha": [100.0, 200.0],
+            "production_t": [50.0, 80.0],
+            "yield_kg_per_ha": [yield_value, yield_value + 1],
+        }
+    )
+
+
+YIELD_PAYLOAD = {
+    "crop_type": "wheat",
+    "year": 2024,
+    "area_harvested_ha": 1000,
+    "production_t": 500,
+}
+
+CONTACT_PAYLOAD = {
+    "name": "Agro Lead",
+    "email": "lead@example.com",
+    "company": "GeoCorp",
+    "topic": "Pilot",
+    "message": "Need a pilot in Kostanay.",
+}
 
 
 def test_models_status(client):
@@ -30,13 +77,7 @@ def test_yield_prediction_endpoint(client, monkeypatch):
         return expected | {"input_features": features}
 
     monkeypatch.setattr(yield_model, "predict_from_features", fake_predict)
-    payload = {
-        "crop_type": "wheat",
-        "year": 2024,
-        "area_harvested_ha": 1000,
-        "production_t": 500,
-    }
-    response = client.post("/api/predict?lang=ru", json=payload)
+    response = client.post("/api/predict?lang=ru", json=YIELD_PAYLOAD)
     assert response.status_code == 200
     body = response.json()
     assert body["lang"] == "ru"
@@ -44,7 +85,41 @@ def test_yield_prediction_endpoint(client, monkeypatch):
     assert body["input_features"]["crop_type"] == "wheat"
 
 
-def test_disease_prediction_endpoint(client, monkeypatch):
+def test_predict_rejects_malformed_and_invalid_yield_bodies(client, monkeypatch):
+    def fail_predict(features):
+        raise AssertionError("invalid payload reached the model")
+
+    monkeypatch.setattr(yield_model, "predict_from_features", fail_predict)
+    headers = {"Content-Type": "application/json"}
+    malformed = client.post("/api/predict", content=b'{"crop_type": "wheat",', headers=headers)
+    assert malformed.status_code == 400
+    assert malformed.json()["detail"].startswith("Invalid JSON body")
+
+    invalid = client.post("/api/predict", json=YIELD_PAYLOAD | {"year": 1900})
+    assert invalid.status_code == 422
+    assert [error["loc"] for error in invalid.json()["detail"]] == [["year"]]
+
+
+@pytest.mark.parametrize(
+    ("lang", "expected"), [("RU-ru", "ru"), ("ru", "ru"), ("en-GB", "en"), ("kk", "en"), ("", "en")]
+)
+def test_predict_normalises_lang_and_falls_back_to_english(client, monkeypatch, lang, expected):
+    monkeypatch.setattr(
+        yield_model, "predict_from_features", lambda features: {"mode": "yield"}
+    )
+    body = client.post("/api/predict", params={"lang": lang}, json=YIELD_PAYLOAD).json()
+    assert body["lang"] == expected
+    assert body["recommendations"] == main.RECOMMENDATIONS["yield"][expected]
+
+
+def test_recommendations_fall_back_to_english_for_untranslated_modes(monkeypatch):
+    monkeypatch.setitem(main.RECOMMENDATIONS_FALLBACK, "survey", ["Walk the field."])
+    payload = main._inject_recommendations({"mode": "survey"}, "ru")
+    assert payload["recommendations"] == ["Walk the field."]
+    assert main._inject_recommendations({"mode": "unknown"}, "ru")["recommendations"] == []
+
+
+def test_disease_prediction_endpoint(client, monkeypatch, sample_png_bytes):
     expected = {
         "mode": "disease",
         "crop": "Potato",
@@ -61,13 +136,9 @@ def test_disease_prediction_endpoint(client, monkeypatch):
         return expected
 
     monkeypatch.setattr(disease_model, "predict_from_bytes", fake_predict)
-    image = Image.new("RGB", (16, 16), color=(255, 0, 0))
-    buffer = BytesIO()
-    image.save(buffer, format="PNG")
-    buffer.seek(0)
     response = client.post(
         "/api/predict",
-        files={"file": ("leaf.png", buffer.read(), "image/png")},
+        files={"file": ("leaf.png", sample_png_bytes, "image/png")},
     )
     assert response.status_code == 200
     body = response.json()
@@ -90,14 +161,7 @@ def test_files_listing(client):
 
 
 def test_contact_endpoint(client):
-    payload = {
-        "name": "Agro Lead",
-        "email": "lead@example.com",
-        "company": "GeoCorp",
-        "topic": "Pilot",
-        "message": "Need a pilot in Kostanay.",
-    }
-    response = client.post("/api/hello", json=payload)
+    response = client.post("/api/hello", json=CONTACT_PAYLOAD)
     assert response.status_code == 200
     assert response.json()["status"] == "received"
 
@@ -116,3 +180,334 @@ def test_yield_history_endpoint(client):
     body = response.json()
     assert "history" in body
     assert "suggested_features" in body
+
+
+def test_file_download_revalidates_with_etag(client):
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    temp_file = DATA_DIR / "pytest_cached.csv"
+    temp_file.write_bytes(b"year,value\n2024,1\n")
+    try:
+        response = client.get(f"/api/files/{temp_file.name}")
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        cached = client.get(f"/api/files/{temp_file.name}", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+
+        listing = client.get("/api/files")
+        assert listing.status_code == 200
+        assert listing.headers["cache-control"] == "no-cache"
+        cached_listing = client.get(
+            "/api/files", headers={"If-None-Match": listing.headers["etag"]}
+        )
+        assert cached_listing.status_code == 304
+    finally:
+        temp_file.unlink(missing_ok=True)
+
+
+def test_event_logger_survives_app_restarts(client, monkeypatch, tmp_path):
+    # Each TestClient lifecycle runs on a fresh event loop, like a reloader restart.
+    logger = EventLogger(tmp_path, batch_window=0)
+    monkeypatch.setattr(main, "event_logger", logger)
+    monkeypatch.setattr(disease_model, "batcher", None)
+    monkeypatch.setenv("GEO_ACTIVE_RUN_ID", "run-pytest")
+    for topic in ("first", "second"):
+        with TestClient(app) as lifecycle:
+            response = lifecycle.post("/api/hello", json=CONTACT_PAYLOAD | {"topic": topic})
+            assert response.status_code == 200
+    log_path = tmp_path / "run-pytest" / "logs" / "contact.log"
+    records = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert [record["topic"] for record in records] == ["first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_event_logger_creates_each_log_dir_once(monkeypatch, tmp_path):
+    logger = EventLogger(tmp_path, batch_window=0)
+    monkeypatch.setenv("GEO_ACTIVE_RUN_ID", "run-pytest")
+    created = []
+    ensure_dir = logger._ensure_dir
+
+    def counting_ensure_dir(log_dir):
+        created.append(log_dir)
+        ensure_dir(log_dir)
+
+    monkeypatch.setattr(logger, "_ensure_dir", counting_ensure_dir)
+    logger.log("contact", {"topic": "inline"})
+    logger.start()
+    try:
+        for topic in ("queued", "again"):
+            logger.log("contact", {"topic": topic})
+            await logger._queue.join()
+        assert created == [tmp_path / "run-pytest" / "logs"]
+
+        shutil.rmtree(tmp_path / "run-pytest")
+        logger.log("contact", {"topic": "recreated"})
+        await logger._queue.join()
+    finally:
+        await logger.stop()
+    log_path = tmp_path / "run-pytest" / "logs" / "contact.log"
+    assert [json.loads(line)["topic"] for line in log_path.read_text().splitlines()] == [
+        "recreated"
+    ]
+
+
+def test_truncated_feather_sidecar_falls_back_to_csv(tmp_path):
+    data_dir = tmp_path / "run-20240101-000000" / "data"
+    data_dir.mkdir(parents=True)
+    _training_rows(1234.5).to_csv(data_dir / "train.csv", index=False)
+    # A sidecar cut short by a crash, but newer than the CSV it mirrors.
+    (data_dir / "train.feather").write_bytes(b"ARROW1\x00\x00")
+
+    history = services.yield_history_payload(tmp_path, None, None, 6)["history"]
+    assert sorted(row["yield"] for row in history) == [1234.5, 1235.5]
+    assert len(pd.read_feather(data_dir / "train.feather")) == 2
+    assert sorted(path.name for path in data_dir.iterdir()) == ["train.csv", "train.feather"]
+
+
+def _write_run(artifacts_dir, run_id: str, yield_value: float, mtime_ns: int) -> None:
+    data_dir = artifacts_dir / run_id / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    parquet_path = data_dir / "train.parquet"
+    _training_rows(yield_value).to_parquet(parquet_path, index=False)
+    # Explicit timestamps: rewrites inside one test can share a coarse filesystem mtime.
+    os.utime(parquet_path, ns=(mtime_ns, mtime_ns))
+    os.utime(artifacts_dir / run_id, ns=(mtime_ns, mtime_ns))
+
+
+def test_dashboard_and_history_follow_the_latest_training_data(tmp_path):
+    artifacts_dir, models_dir = tmp_path / "artifacts", tmp_path / "models"
+    models_dir.mkdir()
+    base_ns = 1_700_000_000 * 10**9
+
+    def snapshot():
+        metrics = services.build_dashboard_metrics(artifacts_dir, models_dir)
+        history = services.yield_history_payload(artifacts_dir, None, None, 6)
+        return metrics["run_id"], {row["yield"] for row in metrics["table"]}, history["run_id"]
+
+    _write_run(artifacts_dir, "run-20240101-000000", 1000.0, base_ns)
+    assert snapshot() == ("run-20240101-000000", {1000.0, 1001.0}, "run-20240101-000000")
+
+    _write_run(artifacts_dir, "run-20240201-000000", 2000.0, base_ns + 10**9)
+    assert snapshot() == ("run-20240201-000000", {2000.0, 2001.0}, "run-20240201-000000")
+
+    # Rewriting the latest split in place refreshes the cached payloads too.
+    _write_run(artifacts_dir, "run-20240201-000000", 3000.0, base_ns + 2 * 10**9)
+    assert snapshot() == ("run-20240201-000000", {3000.0, 3001.0}, "run-20240201-000000")
+
+
+def test_parquet_and_csv_runs_load_with_one_schema(tmp_path):
+    rows = _training_rows(1500.0)
+    parquet_dir = tmp_path / "parquet" / "run-1" / "data"
+    csv_dir = tmp_path / "csv" / "run-1" / "data"
+    parquet_dir.mkdir(parents=True)
+    csv_dir.mkdir(parents=True)
+    rows.astype({"crop_type": "category", "yield_kg_per_ha": "double[pyarrow]"}).to_parquet(
+        parquet_dir / "train.parquet", index=False
+    )
+    rows.to_csv(csv_dir / "train.csv", index=False)
+
+    _, from_parquet = services._load_training_frame(tmp_path / "parquet")
+    _, from_csv = services._load_training_frame(tmp_path / "csv")
+    pd.testing.assert_frame_equal(from_parquet, from_csv)
+
+
+@pytest.mark.asyncio
+async def test_inference_batcher_keeps_request_order():
+    batch_sizes = []
+
+    def predict(batch):
+        batch_sizes.append(len(batch))
+        return batch.reshape(len(batch), -1) * 10
+
+    batcher = InferenceBatcher(predict, max_batch_size=4, batch_timeout_micros=20_000)
+    batcher.start()
+    try:
+        samples = [np.full((1, 2), index, dtype=np.float32) for index in range(10)]
+        outputs = await asyncio.gather(*(batcher.submit(sample) for sample in samples))
+    finally:
+        await batcher.stop()
+    assert [output.tolist() for output in outputs] == [[index * 10.0] * 2 for index in range(10)]
+    assert sum(batch_sizes) == 10
+    assert 1 < max(batch_sizes) <= 4
+
+
+def test_predict_rate_limit_returns_429_once_bucket_is_empty(client, monkeypatch):
+    monkeypatch.setattr(main, "rate_limiter", RateLimiter(rate_per_sec=1e-6, burst=2))
+    monkeypatch.setattr(
+        yield_model, "predict_from_features", lambda features: {"mode": "yield"}
+    )
+    statuses = [client.post("/api/predict", json=YIELD_PAYLOAD).status_code for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_refills_and_forgets_idle_clients(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(main.time, "monotonic", lambda: clock[0])
+    limiter = RateLimiter(rate_per_sec=1.0, burst=2)
+
+    async def consume(key):
+        try:
+            await limiter.consume(key)
+        except main.HTTPException as exc:
+            return exc.status_code
+        return 200
+
+    statuses = [await consume("a") for _ in range(3)]
+    clock[0] += 1.0  # one token back
+    statuses += [await consume("a"), await consume("a")]
+    await consume("b")
+    # Past the refill window the sweep drops "a", whose bucket is full again.
+    clock[0] += limiter.refill_seconds + 1
+    statuses.append(await consume("b"))
+    assert statuses == [200, 200, 429, 200, 429, 200]
+    assert set(limiter._buckets) == {"b"}
+
+
+def test_grouped_pct_change_matches_pandas():
+    frame = pd.DataFrame(
+        {
+            "crop_type": ["a"] * 6 + ["b"] * 3 + ["c"],
+            "value": [100.0, np.nan, 50.0, 0.0, 0.0, 20.0, 0.0, 5.0, 5.0, 7.0],
+        }
+    )
+    codes, _ = pd.factorize(frame["crop_type"], sort=False)
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    expected = frame.groupby("crop_type")["value"].pct_change(fill_method=None).to_numpy()
+    np.testing.assert_array_equal(_pct_change_by_group(frame["value"], starts), expected)
+
+
+def test_grouped_pct_change_accepts_arrow_backed_columns():
+    # load_raw_frames hands tidy_dataframe pyarrow-backed columns, where gaps are pd.NA.
+    values = pd.Series([4.0, 8.0, 2.0, None, 3.0, 6.0], dtype="double[pyarrow]")
+    starts = np.array([0, 3, 5])
+    np.testing.assert_array_equal(
+        _pct_change_by_group(values, starts), [np.nan, 1.0, -0.75, np.nan, np.nan, np.nan]
+    )
+
+
+def test_upload_enforces_size_limit(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "UPLOAD_DIR", tmp_path)
+    # Both bodies exceed the multipart spool threshold, so the on-disk copy path runs.
+    content = os.urandom(MAX_FILE_SIZE)
+    accepted = client.post("/api/upload", files={"file": ("field.bin", content)})
+    assert accepted.status_code == 200
+    assert accepted.json()["size_bytes"] == MAX_FILE_SIZE
+    assert (tmp_path / accepted.json()["filename"]).read_bytes() == content
+
+    rejected = client.post("/api/upload", files={"file": ("field.bin", content + b"x")})
+    assert rejected.status_code == 413
+    assert [path.name for path in tmp_path.iterdir()] == [accepted.json()["filename"]]
+
+
+def test_upload_copy_finishes_after_a_short_sendfile(monkeypatch, tmp_path):
+    if not hasattr(os, "sendfile"):
+        pytest.skip("os.sendfile is not available")
+    source_path = tmp_path / "spool.bin"
+    content = os.urandom(3 * 1024 * 1024)
+    source_path.write_bytes(content)
+    real_sendfile = os.sendfile
+    calls = []
+
+    def short_sendfile(out_fd, in_fd, offset, count):
+        calls.append(offset)
+        return real_sendfile(out_fd, in_fd, offset, min(count, 1024 * 1024)) if offset == 0 else 0
+
+    monkeypatch.setattr(main.os, "sendfile", short_sendfile)
+    destination = tmp_path / "copy.bin"
+    with source_path.open("rb") as source:
+        main._copy_upload(source, destination, len(content))
+    assert calls == [0, 1024 * 1024]
+    assert destination.read_bytes() == content
+
+
+def test_data_assets_refresh_when_a_source_changes(tmp_path):
+    (tmp_path / "first.csv").write_bytes(b"a\n1\n")
+    assert [asset["filename"] for asset in services.list_data_assets([tmp_path])] == [
+        "first.csv"
+    ]
+    (tmp_path / "second.csv").write_bytes(b"a\n2\n")
+    # Within the TTL, but the directory mtime moved, so the cached scan is discarded.
+    later_ns = tmp_path.stat().st_mtime_ns + 10**9
+    os.utime(tmp_path, ns=(later_ns, later_ns))
+    filenames = {asset["filename"] for asset in services.list_data_assets([tmp_path])}
+    assert filenames == {"first.csv", "second.csv"}
+
+
+def test_timestamps_share_one_format(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(yield_model, "_pipeline", None)
+    monkeypatch.setattr(yield_model, "metadata", None)
+    # Whole-second values are where a bare isoformat() drops the fractional part.
+    whole_second = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    asset = tmp_path / "field.csv"
+    asset.write_bytes(b"a\n1\n")
+    os.utime(asset, (whole_second.timestamp(), whole_second.timestamp()))
+    stamps = [
+        client.get("/api/hello").json()["timestamp"],
+        client.post("/api/hello", json=CONTACT_PAYLOAD).json()["timestamp"],
+        client.post("/api/predict", json=YIELD_PAYLOAD).json()["predicted_at"],
+        main.utc_now(whole_second),
+        services.list_data_assets([tmp_path])[0]["modified_iso"],
+    ]
+    assert all(re.fullmatch(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{6}Z", stamp) for stamp in stamps)
+
+
+def test_predict_rejects_oversized_image_before_reading_it(client, monkeypatch):
+    async def fail_predict(image_bytes: bytes):
+        raise AssertionError("oversized image reached the model")
+
+    monkeypatch.setattr(disease_model, "predict_from_bytes_async", fail_predict)
+    response = client.post(
+        "/api/predict", files={"file": ("leaf.png", b"\0" * (MAX_FILE_SIZE + 1), "image/png")}
+    )
+    assert response.status_code == 413
+
+
+def test_data_assets_cache_stays_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(services, "_assets_cache", services.OrderedDict())
+    (tmp_path / "field.csv").write_bytes(b"a\n1\n")
+    for index in range(services.ASSETS_CACHE_SIZE * 2):
+        services.list_data_assets([tmp_path], ["csv", f"ext{index}"])
+    assert len(services._assets_cache) == services.ASSETS_CACHE_SIZE
+    newest = ((str(tmp_path),), frozenset({"csv", f"ext{services.ASSETS_CACHE_SIZE * 2 - 1}"}))
+    assert newest in services._assets_cache
+
+
+def test_broken_onnx_export_falls_back_to_tensorflow(monkeypatch, tmp_path):
+    onnx_path = tmp_path / "plant_model.onnx"
+    onnx_path.write_bytes(b"not an onnx graph")
+    model = DiseaseModel(tmp_path / "plant_model.h5", tmp_path / "labels.json", onnx_path)
+    fallbacks = []
+    monkeypatch.setattr(model, "_load_tensorflow", lambda: fallbacks.append(True) or False)
+    model.load()
+    assert fallbacks == [True]
+    assert model._model is None and model.runtime is None
+
+
+def test_yield_scratch_row_does_not_leak_between_predictions(tmp_path):
+    class RecordingPipeline:
+        def __init__(self):
+            self.frames = []
+
+        def predict(self, frame):
+            self.frames.append(frame.copy())
+            return np.array([1000.0])
+
+    model = YieldModel(tmp_path / "model.pkl", tmp_path / "meta.json", tmp_path / "features.json")
+    model.metadata = {
+        "data": {
+            "numeric_features": ["area_harvested_ha", "production_t", "rainfall"],
+            "categorical_features": ["crop_type"],
+        }
+    }
+    model._prepare_scratch()
+    model._pipeline = pipeline = RecordingPipeline()
+
+    model.predict_from_features(YIELD_PAYLOAD | {"rainfall": 310.0})
+    model.predict_from_features({"crop": "Spring Wheat", "area_harvested": 80, "production": 40})
+    first, second = pipeline.frames
+    assert first.loc[0, "rainfall"] == 310.0 and first.loc[0, "crop_type"] == "wheat"
+    assert np.isnan(second.loc[0, "rainfall"])
+    assert second.loc[0, "crop_type"] == "spring_wheat"
+    assert second.loc[0, ["area_harvested_ha", "production_t"]].tolist() == [80.0, 40.0]
+    assert second.dtypes.astype(str).tolist() == ["float64", "float64", "float64", "object"]